@@ -0,0 +1,120 @@
+from typing import Any, List
+
+import pytest
+
+import tpdp.pipeline as pipeline_module
+from tpdp.pipeline import Pipeline, State, Step
+
+fastloop = pytest.importorskip("tpdp._fastloop")
+
+
+class CountState(State):
+    count: int = 0
+    history: List[int] = []
+
+
+class AddStep(Step):
+    def run(self, state: CountState, delta: int = 1, **kwargs) -> CountState:
+        state.count += delta
+        state.history.append(state.count)
+        return state
+
+
+class AbortStep(Step):
+    def run(self, state: CountState, pipeline_abort=None, **kwargs) -> CountState:
+        pipeline_abort()
+        return state
+
+
+class ErrorStep(Step):
+    def run(self, state: CountState, **kwargs) -> CountState:
+        state.count = -1
+        raise ValueError("error")
+
+
+add_step = AddStep(step_name="add")
+
+
+def build_pipeline(steps: List[Step], **kwargs: Any) -> Pipeline:
+    pipeline = Pipeline(name="FastLoopPipeline", **kwargs)
+    for step in steps:
+        pipeline.registry_step(step)
+
+    return pipeline
+
+
+@pytest.fixture(params=["python", "compiled"])
+def runner(request, monkeypatch):
+    """Run the serial pipelines by the generated python loop or by the compiled loop."""
+
+    monkeypatch.setattr(pipeline_module, "_fastloop", None if request.param == "python" else fastloop)
+    return request.param
+
+
+def summary(pipeline: Pipeline, result) -> Any:
+    steps = [(step_result.name, step_result.correct_finish) for step_result in result.steps_result]
+    return pipeline.get_state(), steps, result.correct_finish, pipeline._pipeline_abort
+
+
+@pytest.mark.parametrize("unsafe_fast", [False, True])
+def test_fastloop_run(runner, unsafe_fast):
+    pipeline = build_pipeline([add_step, add_step, AddStep(step_name="other"), add_step], unsafe_fast=unsafe_fast)
+
+    result = pipeline.run(init_state=CountState(), delta=2)
+
+    assert summary(pipeline, result) == (
+        CountState(count=8, history=[2, 4, 6, 8]),
+        [("add", True), ("add", True), ("other", True), ("add", True)],
+        True,
+        False,
+    )
+    assert isinstance(pipeline.get_state(), CountState)
+
+    # the loop is built once and reused by the following runs
+    result = pipeline.run(init_state=CountState())
+
+    assert pipeline.get_state().count == 4
+    assert len(result.steps_result) == 4
+
+
+@pytest.mark.parametrize("unsafe_fast", [False, True])
+def test_fastloop_abort(runner, unsafe_fast):
+    pipeline = build_pipeline([add_step, AbortStep(step_name="abort"), add_step], unsafe_fast=unsafe_fast)
+
+    result = pipeline.run(init_state=CountState())
+
+    assert summary(pipeline, result) == (
+        CountState(count=1, history=[1]),
+        [("add", True), ("abort", True)],
+        True,
+        True,
+    )
+
+
+@pytest.mark.parametrize("unsafe_fast", [False, True])
+def test_fastloop_error(runner, unsafe_fast):
+    pipeline = build_pipeline([add_step, ErrorStep(step_name="error"), add_step], unsafe_fast=unsafe_fast)
+
+    result = pipeline.run(init_state=CountState())
+
+    assert summary(pipeline, result) == (
+        CountState(count=-1, history=[1]),
+        [("add", True), ("error", False)],
+        False,
+        False,
+    )
+
+
+@pytest.mark.parametrize("unsafe_fast", [False, True])
+def test_fastloop_strict_error(runner, unsafe_fast):
+    pipeline = build_pipeline(
+        [add_step, add_step, ErrorStep(step_name="error"), add_step], ignore_exception=False, unsafe_fast=unsafe_fast
+    )
+
+    with pytest.raises(ValueError):
+        pipeline.run(init_state=CountState())
+
+    # the state is written back to the pipeline by the step before the error
+    assert isinstance(pipeline.get_state(), CountState)
+    assert pipeline.get_state().count == -1
+    assert pipeline.get_state().history == [1, 2]
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+from typing import List
+
+import pytest
+
+from tpdp.jit import numba_step
+from tpdp.pipeline import Pipeline, State, Step, TpdpException
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("numba")
+
+
+class VectorState(State):
+    values: List[float]
+
+
+@numba_step(cache=False)
+class ScaleStep(Step):
+    @staticmethod
+    def kernel(buffer):
+        for i in range(buffer.shape[0]):
+            buffer[i] = buffer[i] * 2.0 + 1.0
+        return buffer
+
+    def _pack_state(self, state: VectorState):
+        return np.asarray(state.values, dtype=np.float64)
+
+    def _unpack_state(self, state: VectorState, buffer) -> VectorState:
+        state.values = buffer.tolist()
+        return state
+
+
+def test_numba_step():
+    step = ScaleStep(step_name="scale")
+
+    pipeline = Pipeline(name="NumbaPipeline")
+    pipeline.registry_step(step)
+    pipeline.registry_step(step)
+
+    warmup_state = VectorState(values=[1.0])
+    pipeline.warmup(warmup_state)
+
+    assert pipeline._unique_steps == [step]
+    assert warmup_state.values == [1.0]
+    assert len(ScaleStep.kernel.signatures) == 1
+
+    result = pipeline.run(init_state=VectorState(values=[0.0, 1.0, 2.0]))
+
+    assert result.correct_finish is True
+    assert pipeline.get_state().values == [3.0, 7.0, 11.0]
+
+
+def test_invalid_numba_step():
+    with pytest.raises(TpdpException):
+
+        @numba_step
+        class InvalidStep(Step):
+            pass
+
+
+def test_import_without_numba():
+    """numba is imported by the first compiled step, not by `import tpdp`."""
+
+    code = "import sys, tpdp; assert 'numba' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
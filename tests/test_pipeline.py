@@ -1,6 +1,14 @@
+import itertools
+import json
+import threading
+import time
+from datetime import timedelta
+from typing import List
+
 import pytest
+from pydantic import ValidationError
 
-from tpdp.pipeline import Pipeline, TpdpException, State, Step, assert_state, assert_step
+from tpdp.pipeline import Pipeline, TpdpException, State, Step, _state_types, assert_state, assert_step
 
 
 def test_simple_state():
@@ -13,6 +21,29 @@ def test_simple_state():
     assert state.dict() == {"state_name": "my_state"}
 
 
+def test_state_assignment():
+    class MyState(State):
+        state_name: str
+        count: int = 0
+
+    class MyValidatedState(MyState):
+        class Config:
+            validate_assignment = True
+
+    state = MyState(state_name="my_state")
+    state.count += 1
+
+    assert state.dict(exclude_unset=True) == {"state_name": "my_state", "count": 1}
+
+    with pytest.raises(ValueError):
+        state.unknown_field = 1
+
+    validated_state = MyValidatedState(state_name="my_state")
+
+    with pytest.raises(ValidationError):
+        validated_state.count = "not a number"
+
+
 def test_invalid_state():
     class MyState:
         def __init__(self, state_name: str):
@@ -24,6 +55,30 @@ def test_invalid_state():
         assert_state(state)
 
 
+def test_state_types_cache():
+    """Classes of accepted states are cached by is_state, other objects are never cached."""
+
+    class CachedState(State):
+        state_name: str
+
+    class NotState:
+        state_name = "state"
+
+    assert CachedState not in _state_types
+
+    assert_state(CachedState(state_name="state"))
+    assert CachedState in _state_types
+    assert assert_state(CachedState(state_name="other")).state_name == "other"
+
+    for invalid in (NotState(), CachedState, {"state_name": "state"}):
+        with pytest.raises(TpdpException):
+            assert_state(invalid)
+
+    assert NotState not in _state_types
+    assert type(CachedState) not in _state_types
+    assert dict not in _state_types
+
+
 def test_simple_step():
     class MyState(State):
         state_name: str
@@ -50,6 +105,17 @@ def test_simple_step():
     assert my_state.my_step_sum == 15
 
 
+def test_step_default_logger():
+    class LoggedStep(Step):
+        def run(self, state: State, **kwargs) -> State:
+            return state
+
+    steps = [LoggedStep(step_name=f"step_{step_id}") for step_id in range(3)]
+
+    assert all(step.logger is steps[0].logger for step in steps)
+    assert len(steps[0].logger.handlers) == 1
+
+
 def test_invalid_step():
     class MyStep:
         pass
@@ -109,6 +175,36 @@ def test_simple_pipeline():
 
     assert pipeline._pipeline_abort is False
 
+    assert pipeline.get_step("step_1") is step_1
+    assert pipeline.get_step("step_2") is step_2
+
+    with pytest.raises(TpdpException):
+        pipeline.get_step("step_3")
+
+
+def test_pipeline_registry_after_run():
+    class CountState(State):
+        count: int = 0
+
+    class CountStep(Step):
+        def run(self, state: CountState, **kwargs) -> CountState:
+            state.count += 1
+            return state
+
+    step = CountStep(step_name="count")
+
+    pipeline = Pipeline(name="CountPipeline")
+    pipeline.registry_step(step)
+
+    pipeline.run(init_state=CountState())
+    assert pipeline.get_state().count == 1
+
+    pipeline.registry_step(step)
+
+    result = pipeline.run(init_state=CountState())
+    assert pipeline.get_state().count == 2
+    assert len(result.steps_result) == 2
+
 
 def test_pipeline_abort():
     """Abort pipeline from a step."""
@@ -177,3 +273,442 @@ def test_pipeline_with_error_not_ignore_exception():
 
     with pytest.raises(ValueError):
         pipeline.run(init_state=State())
+
+
+def test_pipeline_with_independent_steps():
+    """Independent steps run concurrently and their writes are merged."""
+
+    class ExportState(State):
+        source: int = 1
+        csv: int = 0
+        json_: int = 0
+        xml: int = 0
+        exported: bool = False
+
+    barrier = threading.Barrier(3, timeout=5)
+
+    class ExportStep(Step):
+        def __init__(self, field: str, **kwargs) -> None:
+            super().__init__(**kwargs)
+            self.field = field
+
+        def run(self, state: ExportState, **kwargs) -> ExportState:
+            barrier.wait()
+            setattr(state, self.field, state.source + 1)
+            return state
+
+    class FinishStep(Step):
+        def run(self, state: ExportState, **kwargs) -> ExportState:
+            state.exported = state.csv == state.json_ == state.xml == 2
+            return state
+
+    pipeline = Pipeline(name="ExportPipeline", ignore_exception=False)
+
+    pipeline.registry_step(ExportStep(field="csv", step_name="csv"), depends_on=[], reads=["source"], writes=["csv"])
+    pipeline.registry_step(ExportStep(field="json_", step_name="json"), depends_on=[], writes=["json_"])
+    pipeline.registry_step(ExportStep(field="xml", step_name="xml"), depends_on=[], writes=["xml"])
+    pipeline.registry_step(FinishStep(step_name="finish"), depends_on=["csv", "json", "xml"])
+
+    result = pipeline.run(init_state=ExportState())
+
+    assert result.correct_finish is True
+    assert [step_result.name for step_result in result.steps_result] == ["csv", "json", "xml", "finish"]
+    assert pipeline.get_state().exported is True
+
+
+def test_pipeline_with_invalid_dependencies():
+    class MyStep(Step):
+        def run(self, state: State, **kwargs) -> State:
+            return state
+
+    pipeline = Pipeline(name="InvalidPipeline")
+
+    with pytest.raises(TpdpException):
+        pipeline.registry_step(MyStep(step_name="step_1"), depends_on=["step_0"])
+
+    pipeline.registry_step(MyStep(step_name="step_1"), depends_on=[], writes=["field"])
+
+    with pytest.raises(TpdpException):
+        pipeline.registry_step(MyStep(step_name="step_2"), depends_on=[], reads=["field"], writes=["other"])
+
+
+class CounterState(State):
+    n: int = 0
+
+
+class IncrementStep(Step):
+    def run(self, state: CounterState, **kwargs) -> CounterState:
+        state.n += 1
+        return state
+
+
+def test_pipeline_with_undeclared_writes():
+    """A step without declared writes never shares a layer, so no update is lost."""
+
+    pipeline = Pipeline(name="CounterPipeline", ignore_exception=False)
+    pipeline.registry_step(IncrementStep(step_name="first"), depends_on=[])
+    pipeline.registry_step(IncrementStep(step_name="second"), depends_on=[])
+
+    pipeline.run(init_state=CounterState())
+
+    assert pipeline.get_state().n == 2
+
+    pipeline = Pipeline(name="MixedPipeline", ignore_exception=False)
+    pipeline.registry_step(IncrementStep(step_name="first"))
+    pipeline.registry_step(IncrementStep(step_name="second"), depends_on=[])
+
+    pipeline.run(init_state=CounterState())
+
+    assert pipeline._steps_layers == [[0], [1]]
+    assert pipeline.get_state().n == 2
+
+
+def test_pipeline_with_conflicting_branches():
+    """Two concurrent steps changing the same field break the run instead of losing an update."""
+
+    pipeline = Pipeline(name="ConflictPipeline", ignore_exception=False)
+    pipeline.registry_step(IncrementStep(step_name="first"), depends_on=[], writes=["first"])
+    pipeline.registry_step(IncrementStep(step_name="second"), depends_on=[], writes=["second"])
+
+    with pytest.raises(TpdpException):
+        pipeline.run(init_state=CounterState())
+
+
+def test_pipeline_with_undeclared_field_change():
+    """A concurrent step changing a field outside its writes breaks the run instead of losing the change."""
+
+    class ItemsState(State):
+        a: int = 0
+        b: int = 0
+        items: List[int] = []
+
+    class ItemsStep(Step):
+        def run(self, state: ItemsState, **kwargs) -> ItemsState:
+            state.a = 1
+            state.items.append(1)
+            return state
+
+    class BStep(Step):
+        def run(self, state: ItemsState, **kwargs) -> ItemsState:
+            state.b = 1
+            return state
+
+    pipeline = Pipeline(name="ItemsPipeline", ignore_exception=False)
+    pipeline.registry_step(ItemsStep(step_name="items"), depends_on=[], writes=["a"])
+    pipeline.registry_step(BStep(step_name="b"), depends_on=[], writes=["b"])
+
+    with pytest.raises(TpdpException):
+        pipeline.run(init_state=ItemsState())
+
+
+def test_pipeline_stream():
+    class StreamState(State):
+        value: int
+        history: List[int] = []
+
+    class AddStep(Step):
+        def run(self, state: StreamState, delta: int = 1, **kwargs) -> StreamState:
+            state.value += delta
+            state.history.append(state.value)
+            return state
+
+    class AbortStep(Step):
+        def run(self, state: StreamState, pipeline_abort=None, **kwargs) -> StreamState:
+            if state.value > 20:
+                pipeline_abort()
+            return state
+
+    step = AddStep(step_name="add")
+
+    pipeline = Pipeline(name="StreamPipeline")
+    pipeline.registry_step(step)
+    pipeline.registry_step(AbortStep(step_name="abort"))
+    pipeline.registry_step(step)
+
+    outputs = list(pipeline.run_stream((StreamState(value=value * 10) for value in range(5)), delta=2))
+
+    assert [state.value for state, _ in outputs] == [4, 14, 22, 32, 42]
+    assert [len(result.steps_result) for _, result in outputs] == [3, 3, 2, 2, 2]
+    assert all(result.correct_finish for _, result in outputs)
+    assert pipeline._pipeline_abort is False
+
+
+def test_pipeline_stream_with_error():
+    pipeline = Pipeline(name="StreamPipelineWithError")
+    pipeline.registry_step(error_step)
+    pipeline.registry_step(error_step)
+
+    outputs = list(pipeline.run_stream([State(), State()]))
+
+    assert [result.correct_finish for _, result in outputs] == [False, False]
+    assert [len(result.steps_result) for _, result in outputs] == [1, 1]
+
+    pipeline = Pipeline(name="StreamPipelineWithError", ignore_exception=False)
+    pipeline.registry_step(error_step)
+
+    with pytest.raises(ValueError):
+        list(pipeline.run_stream([State(), State()]))
+
+    class ExitStep(Step):
+        def run(self, state: State, **kwargs) -> State:
+            raise SystemExit(1)
+
+    pipeline = Pipeline(name="StreamPipelineWithExit")
+    pipeline.registry_step(ExitStep(step_name="exit"))
+    pipeline.registry_step(error_step)
+
+    with pytest.raises(SystemExit):
+        list(pipeline.run_stream([State(), State()]))
+
+
+def test_pipeline_stream_result_time():
+    """The time which a result waits for the consumer is not counted as the pipeline time."""
+
+    class PassStep(Step):
+        def run(self, state: State, **kwargs) -> State:
+            return state
+
+    pipeline = Pipeline(name="SlowConsumerPipeline")
+    pipeline.registry_step(PassStep(step_name="pass"))
+
+    durations = []
+    for _, result in pipeline.run_stream([State(), State()]):
+        durations.append(result.pipeline_duration)
+        assert result.finish_at - result.start_at < timedelta(seconds=0.1)
+        time.sleep(0.2)
+
+    assert all(duration < 0.1 for duration in durations)
+
+
+def test_pipeline_stream_close():
+    """An unbounded stream is not consumed after the generator is closed."""
+
+    class PassStep(Step):
+        def run(self, state: State, **kwargs) -> State:
+            return state
+
+    pipeline = Pipeline(name="EndlessStreamPipeline")
+    pipeline.registry_step(PassStep(step_name="pass"))
+
+    outputs = pipeline.run_stream(State() for _ in itertools.count())
+    next(outputs)
+    outputs.close()
+
+    pipeline = Pipeline(name="EndlessStreamPipeline", ignore_exception=False)
+    pipeline.registry_step(error_step)
+
+    with pytest.raises(ValueError):
+        list(pipeline.run_stream(State() for _ in itertools.count()))
+
+
+def test_pipeline_result_time():
+    class SleepStep(Step):
+        def run(self, state: State, **kwargs) -> State:
+            time.sleep(0.01)
+            return state
+
+    pipeline = Pipeline(name="SleepPipeline")
+    pipeline.registry_step(SleepStep(step_name="sleep"))
+    pipeline.registry_step(SleepStep(step_name="sleep"))
+
+    result = pipeline.run(init_state=State())
+
+    assert result.pipeline_duration >= 0.02
+    assert abs(result.finish_at - result.start_at - timedelta(seconds=result.pipeline_duration)) <= timedelta(
+        microseconds=1
+    )
+
+    for step_result in result.steps_result:
+        assert step_result.duration >= 0.01
+        assert result.start_at <= step_result.start_at < step_result.finish_at <= result.finish_at
+
+    assert result.steps_result[0].finish_at <= result.steps_result[1].start_at
+
+
+def test_pipeline_batch():
+    pytest.importorskip("numpy")
+
+    class BatchState(State):
+        name: str
+        count: int = 0
+        total: float = 0.0
+
+    class CountStep(Step):
+        def run_vector(self, arrays, **kwargs):
+            arrays["count"] = arrays["count"] + 1
+            return arrays
+
+    class TotalStep(Step):
+        def run(self, state: BatchState, weight: float = 1.0, **kwargs) -> BatchState:
+            state.total += state.count * weight
+            return state
+
+    pipeline = Pipeline(name="BatchPipeline")
+    pipeline.registry_step(CountStep(step_name="count"))
+    pipeline.registry_step(TotalStep(step_name="total"))
+    pipeline.registry_step(CountStep(step_name="count"))
+
+    states = pipeline.run_batch([BatchState(name=f"state_{i}", count=i) for i in range(3)], weight=0.5)
+
+    assert [type(state) for state in states] == [BatchState] * 3
+    assert [state.name for state in states] == ["state_0", "state_1", "state_2"]
+    assert [state.count for state in states] == [2, 3, 4]
+    assert [state.total for state in states] == [0.5, 1.0, 1.5]
+
+    assert pipeline.run_batch([]) == []
+
+    with pytest.raises(TpdpException):
+        pipeline.run_batch([BatchState(name="state"), State()])
+
+    class TagState(State):
+        tags: List[str] = []
+
+    class TagStep(Step):
+        def run(self, state: TagState, **kwargs) -> TagState:
+            state.tags = state.tags + ["tagged"]
+            return state
+
+    pipeline = Pipeline(name="TagPipeline")
+    pipeline.registry_step(TagStep(step_name="tag"))
+
+    states = pipeline.run_batch([TagState(tags=["a"]), TagState(tags=["b", "c"]), TagState(tags=["d", "e"])])
+
+    assert [state.tags for state in states] == [["a", "tagged"], ["b", "c", "tagged"], ["d", "e", "tagged"]]
+
+
+def test_pipeline_unsafe_fast():
+    class FastState(State):
+        name: str
+        count: int = 0
+
+    class CountStep(Step):
+        def run(self, state: FastState, **kwargs) -> FastState:
+            state.count += 1
+            return state
+
+    class NameStep(Step):
+        def run(self, state: FastState, **kwargs) -> FastState:
+            state.name = state.name.upper()
+            return state
+
+    step = CountStep(step_name="count")
+
+    pipeline = Pipeline(name="FastPipeline", unsafe_fast=True)
+    pipeline.registry_step(step)
+    pipeline.registry_step(step)
+
+    init_state = FastState(name="fast")
+    result = pipeline.run(init_state=init_state)
+    final_state = pipeline.get_state()
+
+    assert result.correct_finish is True
+    assert isinstance(final_state, FastState)
+    assert final_state.count == 2
+    assert init_state.count == 0
+
+    pipeline = Pipeline(name="FastPipeline", unsafe_fast=True)
+    pipeline.registry_step(step, depends_on=[], writes=["count"])
+    pipeline.registry_step(NameStep(step_name="name"), depends_on=[])
+
+    pipeline.run(init_state=FastState(name="fast"))
+
+    assert pipeline.get_state() == FastState(name="FAST", count=1)
+
+    class BrokenStep(Step):
+        def run(self, state: FastState, **kwargs) -> FastState:
+            state.count = "broken"
+            raise KeyError("count")
+
+    pipeline = Pipeline(name="FastPipeline", ignore_exception=False, unsafe_fast=True)
+    pipeline.registry_step(BrokenStep(step_name="broken"))
+
+    with pytest.raises(KeyError):
+        pipeline.run(init_state=FastState(name="fast"))
+
+    assert pipeline.get_state().count == "broken"
+
+    pipeline = Pipeline(name="FastPipeline", unsafe_fast=True)
+    pipeline.registry_step(BrokenStep(step_name="broken"))
+
+    result = pipeline.run(init_state=FastState(name="fast"))
+
+    assert result.correct_finish is False
+    assert pipeline.get_state().count == "broken"
+
+
+def test_pipeline_run_kwargs():
+    class SumState(State):
+        total: int = 0
+
+    class SumStep(Step):
+        def run(self, state: SumState, delta: int = 1, **kwargs) -> SumState:
+            assert callable(kwargs["pipeline_abort"])
+            state.total += delta
+            return state
+
+    step = SumStep(step_name="sum")
+
+    pipeline = Pipeline(name="SumPipeline", ignore_exception=False)
+    pipeline.registry_step(step)
+    pipeline.registry_step(step)
+
+    pipeline.run(init_state=SumState())
+    assert pipeline.get_state().total == 2
+
+    pipeline.run(init_state=SumState(), delta=5)
+    assert pipeline.get_state().total == 10
+
+
+def test_pipeline_result_to_json(monkeypatch):
+    pipeline = Pipeline(name="JsonPipeline")
+    pipeline.registry_step(error_step)
+
+    result = pipeline.run(init_state=State())
+    expected = json.loads(result.json())
+
+    assert json.loads(result.to_json()) == expected
+
+    monkeypatch.setattr("tpdp.pipeline.orjson", None)
+
+    assert json.loads(result.to_json()) == expected
+
+
+def test_pipeline_repeated_steps():
+    class RepeatState(State):
+        count: int = 0
+
+    class CountStep(Step):
+        def run(self, state: RepeatState, pipeline_abort=None, limit: int = 100, **kwargs) -> RepeatState:
+            state.count += 1
+            if state.count == limit:
+                pipeline_abort()
+            if state.count > limit:
+                raise ValueError()
+            return state
+
+    step_1 = CountStep(step_name="step_1")
+    step_2 = CountStep(step_name="step_2")
+
+    pipeline = Pipeline(name="RepeatPipeline")
+    for step in [step_1, step_1, step_1, step_2, step_1, step_1]:
+        pipeline.registry_step(step)
+
+    assert pipeline._steps_rle == [(step_1, 3), (step_2, 1), (step_1, 2)]
+
+    result = pipeline.run(init_state=RepeatState())
+    assert pipeline.get_state().count == 6
+    assert [step_result.name for step_result in result.steps_result] == ["step_1"] * 3 + ["step_2"] + ["step_1"] * 2
+
+    result = pipeline.run(init_state=RepeatState(), limit=2)
+    assert pipeline.get_state().count == 2
+    assert len(result.steps_result) == 2
+    assert result.correct_finish is True
+
+    pipeline = Pipeline(name="RepeatPipeline")
+    for step in [step_1, step_1, step_1, step_1]:
+        pipeline.registry_step(step)
+
+    result = pipeline.run(init_state=RepeatState(count=100))
+    assert pipeline.get_state().count == 101
+    assert len(result.steps_result) == 1
+    assert result.correct_finish is False
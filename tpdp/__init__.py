@@ -1,5 +1,6 @@
 from .__info__ import __author__, __email__, __license__, __maintainer__
 from .__version__ import __version__
+from .jit import numba_step
 from .pipeline import Pipeline, State, Step, TpdpException, assert_state, assert_step, is_state, is_step
 
 __all__ = [
@@ -16,4 +17,5 @@ __all__ = [
     "State",
     "Step",
     "Pipeline",
+    "numba_step",
 ]
@@ -0,0 +1,97 @@
+# cython: language_level=3
+"""The compiled driver loop of a sequential pipeline.
+
+The extension is optional, `tpdp.pipeline` falls back to the pure python loop without it.
+Build it in place with `cythonize -i tpdp/_fastloop.pyx`.
+"""
+
+import logging
+
+from posix.time cimport CLOCK_MONOTONIC, clock_gettime, timespec
+
+
+cdef inline long long _monotonic_ns():
+    cdef timespec ts
+    clock_gettime(CLOCK_MONOTONIC, &ts)
+    return <long long>ts.tv_sec * 1000000000 + ts.tv_nsec
+
+
+def monotonic_ns():
+    """The monotonic clock in nanoseconds used for all pipeline timings."""
+    return _monotonic_ns()
+
+
+cdef inline object _call_step(object run, object state, object pipeline_abort, dict kwargs):
+    if kwargs:
+        return run(state, pipeline_abort=pipeline_abort, **kwargs)
+    return run(state, pipeline_abort=pipeline_abort)
+
+
+def run_steps(object pipeline, tuple steps_rle, dict kwargs, bint ignore_exception, object record_type):
+    """Run the steps of a pipeline one by one, see `Pipeline._run_serial`.
+
+    The state of the pipeline is updated even if a step raises an exception.
+
+    Arguments:
+        pipeline: a pipeline with the init state.
+        steps_rle: the registered steps as (step, count) pairs of contiguous registrations.
+        kwargs: keyword arguments of the steps.
+        ignore_exception: catch an exception of a step and stop the pipeline.
+        record_type: a type of the step records.
+
+    Returns:
+        the records of the finished steps.
+
+    """
+    cdef object logger = pipeline.logger
+    cdef bint log_enabled = logger.isEnabledFor(logging.INFO)
+    cdef object pipeline_abort = pipeline._abort_callable
+    cdef object state = pipeline._state
+    cdef list records = []
+    cdef long long start_counter
+    cdef double duration
+    cdef Py_ssize_t count, repeat
+    cdef object step, run, step_name
+    cdef object error = None
+
+    try:
+        for step, count in steps_rle:
+            # the attribute lookups are hoisted out of the loop over repeated registrations
+            run = step.run
+            step_name = step.step_name
+
+            for repeat in range(count):
+                if log_enabled:
+                    logger.info('Step start: step_name="%s"', step_name)
+
+                start_counter = _monotonic_ns()
+
+                if ignore_exception:
+                    try:
+                        state = _call_step(run, state, pipeline_abort, kwargs)
+                    except Exception as e:
+                        error = e
+                else:
+                    state = _call_step(run, state, pipeline_abort, kwargs)
+
+                duration = (_monotonic_ns() - start_counter) * 1e-9
+
+                if log_enabled:
+                    if error is None:
+                        logger.info('Step finish: step_name="%s", step_duration="%6f"', step_name, duration)
+                    else:
+                        logger.info(
+                            'Step finish: step_name="%s", step_duration="%6f", run_error="%s"',
+                            step_name,
+                            duration,
+                            error,
+                        )
+
+                records.append(record_type(step_name, duration, start_counter, error is None))
+
+                if error is not None or pipeline._pipeline_abort:
+                    return records
+    finally:
+        pipeline._state = state
+
+    return records
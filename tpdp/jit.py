@@ -0,0 +1,86 @@
+from __future__ import annotations  # Python < 3.10
+
+from typing import Any, Callable, Optional, Type, TypeVar, cast
+
+from .pipeline import State, Step, TpdpException
+
+
+StepType = TypeVar("StepType", bound=Type[Step])
+
+
+def _run_compiled(self: Any, state: State, pipeline_abort: Optional[Callable[[], None]] = None, **kwargs: Any) -> State:
+    """Run of this step: pack the state, call the compiled kernel and unpack the result."""
+    buffer = self.kernel(self._pack_state(state))
+    return self._unpack_state(state, buffer)
+
+
+def _warmup_compiled(self: Any, state: State) -> None:
+    """Compile the kernel by a call on the packed state."""
+    self.kernel(self._pack_state(state))
+
+
+def numba_step(
+    cls: Optional[StepType] = None, *, cache: bool = True, fastmath: bool = True
+) -> Any:  # StepType or a decorator
+    """Compile a numeric step with numba.
+
+    The decorated step class defines:
+        kernel: a static function which gets a numpy array and returns a numpy array.
+        _pack_state: a method which converts a state to the kernel input.
+        _unpack_state: a method which writes the kernel output to the state and returns the state.
+
+    Example:
+
+        @numba_step
+        class ScaleStep(Step):
+            @staticmethod
+            def kernel(buffer):
+                for i in range(buffer.shape[0]):
+                    buffer[i] *= 2.0
+                return buffer
+
+            def _pack_state(self, state):
+                return np.asarray(state.values, dtype=np.float64)
+
+            def _unpack_state(self, state, buffer):
+                state.values = buffer.tolist()
+                return state
+
+    Arguments:
+        cls: a step class.
+        cache: save the compiled kernel to the file cache.
+        fastmath: allow numba fast math optimizations.
+
+    """
+
+    def decorator(step_cls: StepType) -> StepType:
+        # numba is imported on the first decorated step, so `import tpdp` stays cheap
+        try:
+            import numba
+        except ImportError:
+            # numba is an optional dependency: pip install tpdp[jit]
+            raise TpdpException("numba is required for compiled steps: pip install tpdp[jit]") from None
+
+        if not issubclass(step_cls, Step):
+            raise TpdpException(f"Expected {step_cls} to be a Step subclass.")
+
+        for name in ("kernel", "_pack_state", "_unpack_state"):
+            if not hasattr(step_cls, name):
+                raise TpdpException(f"Step {step_cls.__name__} must define {name} for compilation.")
+
+        # the step class is patched in place: kernel is defined by the user class, not by Step
+        compiled_cls = cast(Any, step_cls)
+
+        # the kernel is compiled lazily by numba on the first call, see `Pipeline.warmup`
+        kernel = numba.njit(cache=cache, fastmath=fastmath)(compiled_cls.kernel)
+
+        compiled_cls.kernel = staticmethod(kernel)
+        compiled_cls.run = _run_compiled
+        compiled_cls.warmup = _warmup_compiled
+
+        return step_cls
+
+    if cls is None:
+        return decorator
+
+    return decorator(cls)
@@ -1,10 +1,16 @@
 from __future__ import annotations  # Python < 3.10
 
+import copy
 import logging
+import queue
 import sys
+import threading
 import time
+from concurrent.futures import Executor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Callable, List, Optional
+from types import SimpleNamespace
+from typing import Any, Callable, ClassVar, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from weakref import WeakSet
 
 from pydantic import BaseModel, Field
 
@@ -14,6 +20,31 @@ else:
     # Use TypeGuard from typing_extensions for python <= 3.9
     from typing_extensions import TypeGuard
 
+try:
+    # orjson is an optional dependency: pip install tpdp[json]
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+try:
+    # the compiled driver loop is optional, see tpdp/_fastloop.pyx
+    from . import _fastloop  # type: ignore[attr-defined]
+except ImportError:
+    _fastloop = None  # type: ignore
+
+# the monotonic clock of all timings: the compiled loop reads the clock itself,
+# so the pure python code must use the same clock
+_counter_ns: Callable[[], int] = time.perf_counter_ns if _fastloop is None else _fastloop.monotonic_ns
+
+
+_STREAM_POLL_INTERVAL = 0.1
+
+# a marker of a state field which is absent before a step
+_MISSING = object()
+
+# default loggers by name, the handler is installed once per logger
+_default_loggers: Dict[str, logging.Logger] = {}
+
 
 #
 # base
@@ -25,6 +56,8 @@ class TpdpException(Exception):
 class _LoggingMixin:
     """LoggingMixin for `tpdp`."""
 
+    __slots__ = ("logger", "__weakref__")
+
     DEFAULT_LOGGER_LEVEL = logging.INFO
     DEFAULT_LOGGER_STREAM = sys.stdout
     DEFAULT_LOGGER_FORMAT = "[%(asctime)s: %(levelname)s] %(name)s: %(message)s"
@@ -33,14 +66,18 @@ class _LoggingMixin:
         self._init_logger(logger)
 
     def _default_logger(self) -> logging.Logger:
-        logger = logging.getLogger(self.__class__.__name__)
+        logger_name = self.__class__.__name__
+        if logger_name in _default_loggers:
+            return _default_loggers[logger_name]
+
+        logger = logging.getLogger(logger_name)
         logger.setLevel(self.DEFAULT_LOGGER_LEVEL)
 
         handler = logging.StreamHandler(stream=self.DEFAULT_LOGGER_STREAM)
         handler.setFormatter(logging.Formatter(fmt=self.DEFAULT_LOGGER_FORMAT))
         logger.addHandler(handler)
 
-        return logger
+        return _default_loggers.setdefault(logger_name, logger)
 
     def _init_logger(self, input_logger: Optional[logging.Logger]) -> None:
         if input_logger is not None:
@@ -76,9 +113,43 @@ class _TimeResultContainer(_BaseDataContainer):
 class State(_BaseDataContainer):
     """A general class for state of some pipeline."""
 
+    # fields which may be assigned without the pydantic checks (see `__setattr__`)
+    __assignable_fields__: ClassVar[FrozenSet[str]] = frozenset()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+
+        config = cls.__config__
+        if config.validate_assignment or not config.allow_mutation or config.frozen:
+            cls.__assignable_fields__ = frozenset()
+        else:
+            cls.__assignable_fields__ = frozenset(name for name, field in cls.__fields__.items() if not field.final)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # fast path for steps mutating the state: a plain field without assignment validation
+        # is written directly, the other cases are handled by pydantic
+        if name in self.__assignable_fields__:
+            self.__dict__[name] = value
+            self.__fields_set__.add(name)
+            return
+
+        super().__setattr__(name, value)
+
+
+# classes of already checked states: isinstance against a pydantic model goes through
+# the python level `ModelMetaclass.__instancecheck__`
+_state_types: WeakSet[type] = WeakSet()
+
 
 def is_state(type_: Any) -> TypeGuard[State]:
-    return isinstance(type_, State)
+    if type(type_) in _state_types:
+        return True
+
+    if isinstance(type_, State):
+        _state_types.add(type(type_))
+        return True
+
+    return False
 
 
 def assert_state(type_: Any) -> State:
@@ -99,9 +170,38 @@ class StepResult(_TimeResultContainer):
     )
 
 
+class _StepRecord(NamedTuple):
+    """Lightweight step result used while the pipeline is running."""
+
+    name: str
+    duration: float
+    start_counter: int
+    correct_finish: bool
+
+    def to_result(self, anchor_time: float, anchor_counter: int) -> StepResult:
+        """Convert to a step result, the wall clock time is derived from the anchor of the pipeline run.
+
+        Arguments:
+            anchor_time: the wall clock time of the pipeline start.
+            anchor_counter: the monotonic clock of the pipeline start.
+
+        """
+        start_time = anchor_time + (self.start_counter - anchor_counter) * 1e-9
+
+        return StepResult(
+            name=self.name,
+            duration=self.duration,
+            start_at=datetime.fromtimestamp(start_time),
+            finish_at=datetime.fromtimestamp(start_time + self.duration),
+            correct_finish=self.correct_finish,
+        )
+
+
 class Step(_LoggingMixin):
     """An abstract class for some pipeline step representation."""
 
+    __slots__ = ("step_name",)
+
     step_name: str
 
     def __init__(self, step_name: str, **kwargs: Any) -> None:
@@ -119,6 +219,26 @@ class Step(_LoggingMixin):
         """
         raise NotImplementedError
 
+    def run_vector(
+        self, arrays: Dict[str, Any], pipeline_abort: Optional[Callable[[], None]] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        """Run of this step for a batch of states, see `Pipeline.run_batch`.
+
+        Arguments:
+            arrays: numpy arrays by state fields, the i-th items of the arrays are the fields of the i-th state.
+            pipeline_abort: hook for pipeline aborting.
+
+        """
+        raise NotImplementedError
+
+    def warmup(self, state: State) -> None:
+        """Prepare this step before the first run, e.g. compile it. The state must not be modified.
+
+        Arguments:
+            state: a state like the states of the pipeline.
+
+        """
+
 
 def is_step(type_: Any) -> TypeGuard[Step]:
     return isinstance(type_, Step)
@@ -142,16 +262,160 @@ class PipelineResult(_TimeResultContainer):
         default=None, description="the duration of finished. None: object is not finished."
     )
 
+    def to_json(self) -> bytes:
+        """Serialize the result to compact JSON, by orjson if it is installed."""
+
+        if orjson is None:
+            return self.json(separators=(",", ":")).encode()
+
+        return orjson.dumps(self.dict())
+
+
+class _StreamItem:
+    """A state which is passing through the stages of a streaming pipeline."""
+
+    __slots__ = (
+        "state",
+        "steps_result",
+        "abort_hook",
+        "kwargs",
+        "start_time",
+        "start_counter",
+        "finish_counter",
+        "correct_finish",
+        "aborted",
+        "error",
+    )
+
+    def __init__(self, state: State, kwargs: Dict[str, Any]) -> None:
+        self.state = state
+        self.steps_result: List[_StepRecord] = []
+        self.abort_hook = self.abort
+        self.kwargs = kwargs
+
+        self.start_time = time.time()
+        self.start_counter = _counter_ns()
+        # updated by each stage which runs a step, so the time in the output queue is not counted
+        self.finish_counter = self.start_counter
+
+        self.correct_finish = True
+        self.aborted = False
+        self.error: Optional[BaseException] = None
+
+    def abort(self) -> None:
+        """Aborting the pipeline for this state only."""
+        self.aborted = True
+
+    def is_active(self) -> bool:
+        return self.correct_finish and not self.aborted
+
+    def get_result(self, pipeline_name: str) -> PipelineResult:
+        duration = (self.finish_counter - self.start_counter) * 1e-9
+
+        return PipelineResult(
+            pipeline_name=pipeline_name,
+            steps_result=[record.to_result(self.start_time, self.start_counter) for record in self.steps_result],
+            pipeline_duration=duration,
+            start_at=datetime.fromtimestamp(self.start_time),
+            finish_at=datetime.fromtimestamp(self.start_time + duration),
+            correct_finish=self.correct_finish,
+        )
+
+
+def _put_stream_item(stage_queue: queue.Queue, item: Optional[_StreamItem], stop: threading.Event) -> bool:
+    """Put an item to a stage queue. False: the stream is stopped and the item is dropped."""
+
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=_STREAM_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+def _get_stream_item(stage_queue: queue.Queue, stop: threading.Event) -> Optional[_StreamItem]:
+    while not stop.is_set():
+        try:
+            return stage_queue.get(timeout=_STREAM_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+
+    return None
+
+
+def _field_array(values: List[Any]) -> Any:
+    """Convert values of a state field to a numpy array of a batch.
+
+    Non-scalar values (lists, dicts, models) are kept in a one-dimensional array of objects,
+    so values of different lengths do not break the conversion.
+    """
+
+    import numpy as np
+
+    if all(isinstance(value, (bool, int, float, str)) for value in values):
+        return np.array(values)
+
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+
+    return array
+
+
+class _StepDependencies(NamedTuple):
+    """Scheduling metadata of a registered step."""
+
+    depends_on: Optional[FrozenSet[str]]
+    reads: FrozenSet[str]
+    writes: Optional[FrozenSet[str]]
+
 
 class Pipeline(_LoggingMixin):
     """A special class with the Pipeline Design Pattern realization."""
 
+    __slots__ = (
+        "_pipeline_name",
+        "_pipeline_abort",
+        "_abort_callable",
+        "_ignore_exception",
+        "_unsafe_fast",
+        "_max_workers",
+        "_stream_queue_size",
+        "_pipeline_start_time",
+        "_pipeline_start_counter",
+        "_pipeline_finish_time",
+        "_pipeline_duration",
+        "_pipeline_start_datetime",
+        "_pipeline_finish_datetime",
+        "_correct_finish",
+        "_state",
+        "_steps",
+        "_unique_steps",
+        "_unique_step_ids",
+        "_steps_rle",
+        "_steps_by_name",
+        "_step_ids_by_name",
+        "_steps_dependencies",
+        "_steps_layers",
+        "_steps_layer_ids",
+        "_steps_result",
+        "_execute_step",
+        "_serial_runner",
+    )
+
     _pipeline_name: str
     _pipeline_abort: bool
+    _abort_callable: Callable[[], None]
 
     _ignore_exception: bool
+    _unsafe_fast: bool
+    _max_workers: Optional[int]
+    _stream_queue_size: int
 
     _pipeline_start_time: float
+    _pipeline_start_counter: int
     _pipeline_finish_time: float
     _pipeline_duration: float
 
@@ -162,23 +426,54 @@ class Pipeline(_LoggingMixin):
 
     _state: State
     _steps: List[Step]
-    _steps_result: List[StepResult]
+    _unique_steps: List[Step]
+    _unique_step_ids: Dict[int, int]
+    # contiguous registrations of the same step folded to (step, count)
+    _steps_rle: List[Tuple[Step, int]]
+    _steps_by_name: Dict[str, Step]
+    _step_ids_by_name: Dict[str, List[int]]
+    _steps_dependencies: List[_StepDependencies]
+    _steps_layers: List[List[int]]
+    _steps_layer_ids: List[int]
+    _steps_result: List[_StepRecord]
+
+    # `_execute_step_safe` or `_execute_step_strict` depending on `ignore_exception`
+    _execute_step: Callable[..., Tuple[State, _StepRecord]]
+    # the sequential run loop generated for the registered steps, see `_compile_serial_runner`
+    _serial_runner: Optional[Callable[[Pipeline, Dict[str, Any]], None]]
 
     def __init__(
         self,
         name: str,
         ignore_exception: bool = True,
+        unsafe_fast: bool = False,
+        max_workers: Optional[int] = None,
+        stream_queue_size: int = 2,
         **kwargs: Any,
     ):
         super(Pipeline, self).__init__(**kwargs)
 
         self._pipeline_abort = False
+        self._abort_callable = self.pipeline_abort
         self._pipeline_name = name
 
         self._ignore_exception = ignore_exception
+        self._execute_step = self._execute_step_safe if ignore_exception else self._execute_step_strict
+        self._unsafe_fast = unsafe_fast
+        self._max_workers = max_workers
+        self._stream_queue_size = stream_queue_size
 
         self._steps = []
+        self._unique_steps = []
+        self._unique_step_ids = {}
+        self._steps_rle = []
+        self._steps_by_name = {}
+        self._step_ids_by_name = {}
+        self._steps_dependencies = []
+        self._steps_layers = []
+        self._steps_layer_ids = []
         self._steps_result = []
+        self._serial_runner = None
 
     def _pipeline_start_log(self) -> None:
         self.logger.info(
@@ -196,85 +491,501 @@ class Pipeline(_LoggingMixin):
         )
 
     def _start_pipeline(self) -> None:
+        self._pipeline_start_counter = _counter_ns()
         self._pipeline_start_time = time.time()
-        self._pipeline_start_datetime = datetime.now()
+        self._pipeline_start_datetime = datetime.fromtimestamp(self._pipeline_start_time)
 
         self._pipeline_start_log()
 
     def _finish_pipeline(self) -> None:
-        self._pipeline_finish_time = time.time()
-        self._pipeline_finish_datetime = datetime.now()
-        self._pipeline_duration = self._pipeline_finish_time - self._pipeline_start_time
+        self._pipeline_duration = (_counter_ns() - self._pipeline_start_counter) * 1e-9
+        self._pipeline_finish_time = self._pipeline_start_time + self._pipeline_duration
+        self._pipeline_finish_datetime = datetime.fromtimestamp(self._pipeline_finish_time)
 
         self._pipeline_finish_log()
 
     def _get_pipeline_result(self) -> PipelineResult:
         return PipelineResult(
             pipeline_name=self._pipeline_name,
-            steps_result=self._steps_result,
+            steps_result=[
+                record.to_result(self._pipeline_start_time, self._pipeline_start_counter)
+                for record in self._steps_result
+            ],
             pipeline_duration=self._pipeline_duration,
             start_at=self._pipeline_start_datetime,
             finish_at=self._pipeline_finish_datetime,
             correct_finish=self._correct_finish,
         )
 
-    def _run_step(self, step: Step, **kwargs: Any) -> StepResult:
-        self.logger.info('Step start: step_name="%s"', step.step_name)
+    def _finish_step(self, step: Step, start_counter: int, error: Optional[Exception] = None) -> _StepRecord:
+        step_duration = (_counter_ns() - start_counter) * 1e-9
+
+        # the messages are formatted by logging only if INFO level is enabled
+        if error is None:
+            self.logger.info('Step finish: step_name="%s", step_duration="%6f"', step.step_name, step_duration)
+        else:
+            self.logger.info(
+                'Step finish: step_name="%s", step_duration="%6f", run_error="%s"',
+                step.step_name,
+                step_duration,
+                error,
+            )
 
-        step_start_time = time.time()
-        step_start_datetime = datetime.now()
+        return _StepRecord(step.step_name, step_duration, start_counter, error is None)
+
+    def _execute_step_safe(
+        self, step: Step, state: State, pipeline_abort: Callable[[], None], kwargs: Dict[str, Any]
+    ) -> Tuple[State, _StepRecord]:
+        """Run a step and catch its exception (`ignore_exception=True`)."""
+
+        self.logger.info('Step start: step_name="%s"', step.step_name)
 
-        step_correct_finish = True
-        error_message = ""
+        # the wall clock is read once per pipeline run, see `_StepRecord.to_result`
+        step_start_counter = _counter_ns()
 
         try:
-            self._state = step.run(self._state, pipeline_abort=self.pipeline_abort, **kwargs)
+            # the call without `**kwargs` unpacking is the common case
+            if kwargs:
+                state = step.run(state, pipeline_abort=pipeline_abort, **kwargs)
+            else:
+                state = step.run(state, pipeline_abort=pipeline_abort)
         except Exception as e:
-            step_correct_finish = False
+            return state, self._finish_step(step, step_start_counter, e)
 
-            if self._ignore_exception is True:
-                error_message = str(e)
-            else:
-                raise e
-
-        step_finish_time = time.time()
-        step_finish_datetime = datetime.now()
-        step_duration = step_finish_time - step_start_time
-
-        result = StepResult(
-            name=step.step_name,
-            duration=step_duration,
-            start_at=step_start_datetime,
-            finish_at=step_finish_datetime,
-            correct_finish=step_correct_finish,
-        )
+        return state, self._finish_step(step, step_start_counter)
 
-        run_msg = f'Step finish: step_name="{step.step_name}", step_duration="{step_duration:6f}"'
+    def _execute_step_strict(
+        self, step: Step, state: State, pipeline_abort: Callable[[], None], kwargs: Dict[str, Any]
+    ) -> Tuple[State, _StepRecord]:
+        """Run a step and let its exception propagate (`ignore_exception=False`)."""
+
+        self.logger.info('Step start: step_name="%s"', step.step_name)
 
-        if not step_correct_finish:
-            run_msg += f', run_error="{error_message}"'
+        step_start_counter = _counter_ns()
 
-        self.logger.info(run_msg)
+        if kwargs:
+            state = step.run(state, pipeline_abort=pipeline_abort, **kwargs)
+        else:
+            state = step.run(state, pipeline_abort=pipeline_abort)
 
+        return state, self._finish_step(step, step_start_counter)
+
+    def _run_step(self, step: Step, kwargs: Dict[str, Any]) -> _StepRecord:
+        self._state, result = self._execute_step(step, self._state, self._abort_callable, kwargs)
         return result
 
+    def _run_layer(self, executor: Executor, layer: List[int], kwargs: Dict[str, Any]) -> List[_StepRecord]:
+        """Run independent steps concurrently, each on its own copy of the state."""
+
+        futures = [
+            executor.submit(
+                self._execute_step, self._steps[step_id], copy.deepcopy(self._state), self._abort_callable, kwargs
+            )
+            for step_id in layer
+        ]
+        branches = [future.result() for future in futures]
+
+        # `vars` works both for a pydantic state and for the namespace of `unsafe_fast` mode,
+        # where a step may add a new attribute
+        origin = dict(vars(self._state))
+        changed_by: Dict[str, int] = {}
+        for step_id, (state, _) in zip(layer, branches):
+            writes = self._steps_dependencies[step_id].writes
+            for name, value in vars(state).items():
+                if value == origin.get(name, _MISSING):
+                    continue
+
+                if writes is not None and name not in writes:
+                    raise TpdpException(
+                        f"Step {self._steps[step_id].step_name} changed the state field {name} "
+                        "which is not declared in its writes."
+                    )
+                if name in changed_by:
+                    raise TpdpException(
+                        f"Steps {self._steps[changed_by[name]].step_name} and {self._steps[step_id].step_name} "
+                        f"both changed the state field {name}; declare an explicit dependency between them."
+                    )
+                changed_by[name] = step_id
+
+        for step_id, (state, _) in zip(layer, branches):
+            writes = self._steps_dependencies[step_id].writes
+            if writes is None:
+                writes = frozenset(name for name, changer_id in changed_by.items() if changer_id == step_id)
+
+            for name in writes:
+                setattr(self._state, name, getattr(state, name))
+
+        return [result for _, result in branches]
+
+    def _compile_serial_runner(self) -> Callable[[Pipeline, Dict[str, Any]], None]:
+        """Build the sequential run loop for the registered steps.
+
+        The compiled loop of `tpdp._fastloop` is used if the extension is built,
+        otherwise a python function unrolled for the registered steps is generated.
+
+        """
+
+        if _fastloop is not None:
+            steps_rle = tuple(self._steps_rle)
+
+            def _run_serial_compiled(pipeline: Pipeline, kwargs: Dict[str, Any]) -> None:
+                pipeline._steps_result = _fastloop.run_steps(
+                    pipeline, steps_rle, kwargs, pipeline._ignore_exception, _StepRecord
+                )
+
+            return _run_serial_compiled
+
+        namespace: Dict[str, Any] = {}
+        lines = [
+            "def _run_serial(self, kwargs):",
+            "    execute = self._execute_step",
+            "    abort = self._abort_callable",
+            "    results = self._steps_result",
+        ]
+
+        step_id = 0
+        for step, count in self._steps_rle:
+            step_slot = self._unique_step_ids[id(step)]
+            namespace[f"_step_{step_slot}"] = step
+
+            # `_steps_result` is allocated by `run` and truncated when the pipeline stops early
+            if count == 1:
+                lines += [
+                    f"    self._state, record = execute(_step_{step_slot}, self._state, abort, kwargs)",
+                    f"    results[{step_id}] = record",
+                    "    if not record.correct_finish or self._pipeline_abort:",
+                    f"        del results[{step_id + 1}:]",
+                    "        return",
+                ]
+            else:
+                lines += [
+                    f"    for repeat in range({count}):",
+                    f"        self._state, record = execute(_step_{step_slot}, self._state, abort, kwargs)",
+                    f"        results[{step_id} + repeat] = record",
+                    "        if not record.correct_finish or self._pipeline_abort:",
+                    f"            del results[{step_id + 1} + repeat:]",
+                    "            return",
+                ]
+
+            step_id += count
+
+        lines.append("    return")
+
+        exec(compile("\n".join(lines), f"<tpdp pipeline {self._pipeline_name}>", "exec"), namespace)
+        return namespace["_run_serial"]
+
+    def _run_serial(self, kwargs: Dict[str, Any]) -> None:
+        if self._serial_runner is None:
+            self._serial_runner = self._compile_serial_runner()
+
+        self._serial_runner(self, kwargs)
+
+        last_result = self._steps_result[-1]
+        if not last_result.correct_finish:
+            self._correct_finish = False
+        elif self._pipeline_abort is True:
+            self.logger.info('Pipeline was aborted by a step: step_name="%s"', last_result.name)
+
+    def _run_layers(self, kwargs: Dict[str, Any]) -> None:
+        finished = 0
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            for layer in self._steps_layers:
+                if len(layer) == 1:
+                    layer_result = [self._run_step(self._steps[layer[0]], kwargs)]
+                else:
+                    layer_result = self._run_layer(executor, layer, kwargs)
+
+                self._steps_result[finished : finished + len(layer_result)] = layer_result
+                finished += len(layer_result)
+
+                if not all(step_result.correct_finish for step_result in layer_result):
+                    self._correct_finish = False
+                    break
+
+                if self._pipeline_abort is True:
+                    self.logger.info(
+                        'Pipeline was aborted by a step: step_name="%s"',
+                        ", ".join(self._steps[step_id].step_name for step_id in layer),
+                    )
+                    break
+
+        del self._steps_result[finished:]
+
+    def _feed_stream(
+        self, states: Iterable[State], kwargs: Dict[str, Any], outbox: queue.Queue, stop: threading.Event
+    ) -> None:
+        try:
+            for state in states:
+                # the input may be unbounded, so it is not consumed after the stream is stopped
+                if stop.is_set() or not _put_stream_item(outbox, _StreamItem(assert_state(state), kwargs), stop):
+                    break
+        except BaseException as e:
+            # an invalid state or a broken iterator is reported to the consumer
+            item = _StreamItem(State(), kwargs)
+            item.error = e
+            _put_stream_item(outbox, item, stop)
+        finally:
+            _put_stream_item(outbox, None, stop)
+
+    def _run_stream_stage(self, step: Step, inbox: queue.Queue, outbox: queue.Queue, stop: threading.Event) -> None:
+        while True:
+            item = _get_stream_item(inbox, stop)
+            if item is None:
+                _put_stream_item(outbox, None, stop)
+                return
+
+            if item.error is None and item.is_active():
+                try:
+                    item.state, step_result = self._execute_step(step, item.state, item.abort_hook, item.kwargs)
+                except BaseException as e:
+                    # also `SystemExit` and alike, the thread must stay alive to forward the end of the stream
+                    item.error = e
+                else:
+                    item.steps_result.append(step_result)
+                    item.correct_finish = step_result.correct_finish
+
+                    if item.aborted:
+                        self.logger.info('Pipeline was aborted by a step: step_name="%s"', step.step_name)
+
+                item.finish_counter = _counter_ns()
+
+            _put_stream_item(outbox, item, stop)
+
     def pipeline_abort(self) -> None:
         """Aborting the pipeline."""
         self._pipeline_abort = True
 
-    def registry_step(self, step: Step) -> None:
-        """Registry a step to pipeline."""
+    def _get_step_layer(self, step: Step, dependencies: _StepDependencies) -> int:
+        if dependencies.depends_on is None:
+            # a step without explicit dependencies waits for all previously registered steps
+            return len(self._steps_layers)
+
+        layer_id = 0
+        for step_name in dependencies.depends_on:
+            parents = self._step_ids_by_name.get(step_name)
+            if parents is None:
+                raise TpdpException(f"Step {step.step_name} depends on unregistered step {step_name}.")
+
+            layer_id = max(layer_id, max(self._steps_layer_ids[step_id] for step_id in parents) + 1)
+
+        # a step with undeclared writes may conflict with any step, so it never shares a layer with one
+        while layer_id < len(self._steps_layers):
+            writes = dependencies.writes
+            neighbours = [(step_id, self._steps_dependencies[step_id]) for step_id in self._steps_layers[layer_id]]
+            if writes is None or any(neighbour.writes is None for _, neighbour in neighbours):
+                layer_id += 1
+                continue
+
+            for step_id, neighbour in neighbours:
+                if neighbour.writes is not None and (
+                    writes & (neighbour.writes | neighbour.reads) or dependencies.reads & neighbour.writes
+                ):
+                    raise TpdpException(
+                        f"Step {step.step_name} conflicts with step {self._steps[step_id].step_name} "
+                        "on state fields; declare an explicit dependency between them."
+                    )
+            break
+
+        return layer_id
+
+    def registry_step(
+        self,
+        step: Step,
+        depends_on: Optional[Iterable[str]] = None,
+        reads: Optional[Iterable[str]] = None,
+        writes: Optional[Iterable[str]] = None,
+    ) -> None:
+        """Registry a step to pipeline.
+
+        Arguments:
+            step: a step for registration.
+            depends_on: names of registered steps which must be finished before this step.
+                None: the step runs after all previously registered steps.
+            reads: state fields which the step reads.
+            writes: state fields which the step modifies. None: all modified fields.
+
+        """
 
         assert_step(step)
 
+        dependencies = _StepDependencies(
+            depends_on=None if depends_on is None else frozenset(depends_on),
+            reads=frozenset(reads or ()),
+            writes=None if writes is None else frozenset(writes),
+        )
+        layer_id = self._get_step_layer(step, dependencies)
+
+        if layer_id == len(self._steps_layers):
+            self._steps_layers.append([])
+        self._steps_layers[layer_id].append(len(self._steps))
+
+        # a step registered several times is stored once in the unique steps
+        if id(step) not in self._unique_step_ids:
+            self._unique_step_ids[id(step)] = len(self._unique_steps)
+            self._unique_steps.append(step)
+
+        if self._steps_rle and self._steps_rle[-1][0] is step:
+            self._steps_rle[-1] = (step, self._steps_rle[-1][1] + 1)
+        else:
+            self._steps_rle.append((step, 1))
+
+        self._steps_by_name.setdefault(step.step_name, step)
+        self._step_ids_by_name.setdefault(step.step_name, []).append(len(self._steps))
+
         self._steps.append(step)
+        self._steps_dependencies.append(dependencies)
+        self._steps_layer_ids.append(layer_id)
+        self._serial_runner = None
         self.logger.info('Step registered: step_name="%s"', step.step_name)
 
+    def run_stream(self, states: Iterable[State], **kwargs: Any) -> Iterator[Tuple[State, PipelineResult]]:
+        """Run the pipeline for each state of a stream.
+
+        Each registered step works in its own thread, so a step processes the next state
+        while the following steps process the previous ones. Steps run in the registration order.
+
+        Arguments:
+            states: init states.
+
+        Yields:
+            final state and result of the pipeline for each init state in the input order.
+
+        """
+
+        if len(self._steps) == 0:
+            self.logger.warning("Empty steps sequence")
+
+        stop = threading.Event()
+        queues: List[queue.Queue] = [queue.Queue(maxsize=self._stream_queue_size) for _ in range(len(self._steps) + 1)]
+
+        workers = [threading.Thread(target=self._feed_stream, args=(states, kwargs, queues[0], stop), daemon=True)]
+        for step_id, step in enumerate(self._steps):
+            worker = threading.Thread(
+                target=self._run_stream_stage,
+                args=(step, queues[step_id], queues[step_id + 1], stop),
+                daemon=True,
+            )
+            workers.append(worker)
+
+        for worker in workers:
+            worker.start()
+
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is None:
+                    break
+
+                if item.error is not None:
+                    raise item.error
+
+                yield item.state, item.get_result(self._pipeline_name)
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+    def get_step(self, step_name: str) -> Step:
+        """Get a registered step by name.
+
+        If several steps are registered with the same name, the first one is returned.
+
+        """
+
+        try:
+            return self._steps_by_name[step_name]
+        except KeyError:
+            raise TpdpException(f"Step {step_name} is not registered.") from None
+
+    def _run_vector_by_states(
+        self, step: Step, state_type: type, arrays: Dict[str, Any], step_kwargs: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Run a step without `run_vector` for each state of a batch."""
+
+        columns = {name: array.tolist() for name, array in arrays.items()}
+        size = len(next(iter(columns.values())))
+
+        states = [state_type(**{name: column[i] for name, column in columns.items()}) for i in range(size)]
+        states = [step.run(state, **step_kwargs) for state in states]
+
+        return {name: _field_array([getattr(state, name) for state in states]) for name in arrays}
+
+    def run_batch(self, states: List[State], **kwargs: Any) -> List[State]:
+        """Run the pipeline for a batch of states of the same type.
+
+        The batch is converted to numpy arrays by state fields once and each step processes
+        all the states by one `Step.run_vector` call. Steps without `run_vector` are run for
+        each state. Exceptions of the steps are raised regardless of `ignore_exception`.
+
+        Arguments:
+            states: init states.
+
+        Returns:
+            final states in the input order.
+
+        """
+
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise TpdpException("numpy is required for running a batch: pip install numpy") from None
+
+        if len(states) == 0:
+            return []
+
+        state_type = type(assert_state(states[0]))
+        for state in states:
+            if type(state) is not state_type:
+                raise TpdpException(f"Expected {state} to be a {state_type.__name__} type.")
+
+        arrays = {name: _field_array([getattr(state, name) for state in states]) for name in state_type.__fields__}
+        step_kwargs = {**kwargs, "pipeline_abort": self._abort_callable}
+
+        for step in self._steps:
+            self.logger.info('Step start: step_name="%s", batch_size="%s"', step.step_name, len(states))
+
+            if type(step).run_vector is Step.run_vector:
+                arrays = self._run_vector_by_states(step, state_type, arrays, step_kwargs)
+            else:
+                arrays = step.run_vector(arrays, **step_kwargs)
+
+            self.logger.info('Step finish: step_name="%s"', step.step_name)
+
+            if self._pipeline_abort is True:
+                self.logger.info('Pipeline was aborted by a step: step_name="%s"', step.step_name)
+                break
+
+        columns = {name: array.tolist() for name, array in arrays.items()}
+        return [state_type(**{name: column[i] for name, column in columns.items()}) for i in range(len(states))]
+
+    def warmup(self, state: State) -> None:
+        """Warm up each registered step, so the first run is not slowed down by step preparing.
+
+        Arguments:
+            state: a state like the init states of the pipeline.
+
+        """
+
+        assert_state(state)
+
+        for step in self._unique_steps:
+            step.warmup(state)
+
     def get_state(self) -> State:
         return self._state
 
     def run(self, init_state: State, **kwargs: Any) -> PipelineResult:
-        """Run the pipeline."""
+        """Run the pipeline.
+
+        With `unsafe_fast=True` the steps get a `types.SimpleNamespace` with the fields of the init state
+        instead of the state itself, and the final state is created and validated once after the last step.
+        After a step error or an abort the final state is created without validation.
+
+        Arguments:
+            init_state: init state.
+
+        """
 
         self._start_pipeline()
 
@@ -282,6 +993,8 @@ class Pipeline(_LoggingMixin):
         assert_state(self._state)
 
         self._correct_finish = True
+        # the results are assigned by the step positions, see `_run_serial` and `_run_layers`
+        self._steps_result = [None] * len(self._steps)  # type: ignore[list-item]
 
         if len(self._steps) == 0:
             self.logger.warning("Empty steps sequence")
@@ -289,17 +1002,27 @@ class Pipeline(_LoggingMixin):
 
             return self._get_pipeline_result()
 
-        for step in self._steps:
-            step_result = self._run_step(step, **kwargs)
-            self._steps_result.append(step_result)
-
-            if not step_result.correct_finish:
-                self._correct_finish = False
-                break
+        if self._unsafe_fast:
+            # steps modify a plain namespace, the state is validated once after the run
+            self._state = SimpleNamespace(**dict(init_state))  # type: ignore[assignment]
 
-            if self._pipeline_abort is True:
-                self.logger.info('Pipeline was aborted by a step: step_name="%s"', step.step_name)
-                break
+        try:
+            if len(self._steps_layers) == len(self._steps):
+                self._run_serial(kwargs)
+            else:
+                self._run_layers(kwargs)
+        except BaseException:
+            if self._unsafe_fast:
+                # keep the step exception, the partial state is not validated
+                self._state = type(init_state).construct(**vars(self._state))
+            raise
+
+        if self._unsafe_fast:
+            if self._correct_finish and not self._pipeline_abort:
+                self._state = type(init_state)(**vars(self._state))
+            else:
+                # an ignored step error or an abort may leave a partial state, it is not validated
+                self._state = type(init_state).construct(**vars(self._state))
 
         self._finish_pipeline()
         return self._get_pipeline_result()